@@ -1,7 +1,15 @@
 # collector/api_client.py
-# VERSION: v1.4.1
+# VERSION: v1.6.1
 #
 # CHANGELOG:
+# - FIX: exclusiveStart=false; el tie-set del cursor deduplica los
+#   eventos del timestamp del watermark
+# - FIX: un 401 del endpoint de eventos se reintenta una vez con
+#   token nuevo antes de fallar
+# - Errores HTTP como ApiError (status real); 401 invalida el token
+# - REQUEST_TIMEOUT en el fetch (shutdown acotado)
+# - Usa la sesión HTTP de la credencial (pool compartido)
+# - NEW: etapa opcional de enriquecimiento (device / organization)
 # - Se añade normalización de campos categorías EDR y Riesgo
 # - Envuelve el evento original en estructura:
 #   {
@@ -14,8 +22,8 @@
 # - Compatible con Wazuh / OpenSearch / SIEMs
 
 import logging
-import requests
 from datetime import datetime, timezone, timedelta
+from collector.authentication import ApiError, REQUEST_TIMEOUT
 from collector.normalizers import (
     normalize_categories,
     normalize_risk
@@ -83,7 +91,7 @@ def _epoch_to_iso(value):
 # ----------------------------------------------------------------------
 # Fetch events
 # ----------------------------------------------------------------------
-def fetch_events(auth, last_ts, anchor=None, org_id=None):
+def fetch_events(auth, last_ts, anchor=None, org_id=None, enricher=None):
     token = auth.authenticate()
 
     headers = {
@@ -101,7 +109,11 @@ def fetch_events(auth, last_ts, anchor=None, org_id=None):
         "engineGroup": ["epp", "edr"],
         "persistenceTimestampStart": last_ts,
         "order": "asc",
-        "exclusiveStart": "true",
+        # Inicio inclusivo: los eventos con el mismo timestamp que el
+        # watermark se vuelven a pedir y el tie-set del cursor descarta
+        # los ya entregados (con exclusivo se perderían los que llegan
+        # después con ese timestamp)
+        "exclusiveStart": "false",
         "language": "es-MX",
     }
 
@@ -111,14 +123,27 @@ def fetch_events(auth, last_ts, anchor=None, org_id=None):
     if org_id:
         params["organizationId"] = org_id
 
-    resp = requests.post(
-        API_URL + EVENTS_PATH,
-        headers=headers,
-        data=params
-    )
+    # 401: token revocado / expirado antes de tiempo -> un reintento
+    # con token nuevo antes de contarlo como error de credencial
+    for attempt in range(2):
+        resp = auth.session.post(
+            API_URL + EVENTS_PATH,
+            headers=headers,
+            data=params,
+            timeout=REQUEST_TIMEOUT
+        )
+
+        if resp.status_code != 401 or attempt:
+            break
+
+        log.warning("Event fetch returned 401, retrying with a fresh token")
+        auth.invalidate()
+        headers["Authorization"] = f"Bearer {auth.authenticate()}"
 
     if not resp.ok:
-        raise RuntimeError(f"Event fetch failed: {resp.text}")
+        if resp.status_code == 401:
+            auth.invalidate()
+        raise ApiError.from_response(resp, "Event fetch failed")
 
     payload = resp.json()
     raw_items = payload.get("items", [])
@@ -186,4 +211,10 @@ def fetch_events(auth, last_ts, anchor=None, org_id=None):
             "withsecure": event
         })
 
+    # ------------------------------------------------------------------
+    # ENRICHMENT (cached device / organization metadata)
+    # ------------------------------------------------------------------
+    if enricher and wrapped_items:
+        enricher.enrich(wrapped_items, org_id=org_id)
+
     return wrapped_items, payload.get("nextAnchor")
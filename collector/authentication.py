@@ -1,11 +1,18 @@
 # collector/authentication.py
-# VERSION: v1.3.0
+# VERSION: v1.5.0
+# NEW:
+# - ApiError con status HTTP real y Retry-After (circuit breaker)
+# - invalidate() fuerza un token nuevo tras un 401
+# - REQUEST_TIMEOUT en todas las llamadas HTTP (shutdown acotado)
+# - Sesión HTTP compartida (pool de conexiones por credencial)
+# - Renueva el token antes de 'expires_in'
 # FIX:
 # - Restored correct Basic Auth header
 # - Base64(client_id:client_secret)
 # - Compatible with WithSecure OAuth2
 
 import logging
+import time
 import requests
 from base64 import b64encode
 
@@ -13,14 +20,46 @@ log = logging.getLogger(__name__)
 
 TOKEN_URL = "https://api.connect.withsecure.com/as/token.oauth2"
 
+# Margen para renovar el token antes de que expire (segundos)
+TOKEN_REFRESH_MARGIN = 60
+
+# (connect, read) en segundos para todas las llamadas a la API
+REQUEST_TIMEOUT = (5, 30)
+
+class ApiError(RuntimeError):
+    """
+    Error HTTP de la API WithSecure con su status real.
+    """
+
+    def __init__(self, status_code: int, message: str, retry_after=None):
+        super().__init__(f"{message} (HTTP {status_code})")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_response(cls, response, message: str):
+        retry_after = response.headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        return cls(response.status_code, f"{message}: {response.text}", retry_after)
+
+
 class WithSecureAuth:
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(self, client_id: str, client_secret: str, session=None):
         self.client_id = client_id
         self.client_secret = client_secret
+        self.session = session or requests.Session()
+        self._token = None
+        self._expires_at = 0.0
+
+    def invalidate(self):
         self._token = None
+        self._expires_at = 0.0
 
     def authenticate(self) -> str:
-        if self._token:
+        if self._token and time.monotonic() < self._expires_at:
             return self._token
 
         credentials = f"{self.client_id}:{self.client_secret}"
@@ -38,12 +77,24 @@ class WithSecureAuth:
             "scope": "connect.api.read"
         }
 
-        response = requests.post(TOKEN_URL, headers=headers, data=data)
+        response = self.session.post(
+            TOKEN_URL,
+            headers=headers,
+            data=data,
+            timeout=REQUEST_TIMEOUT
+        )
 
         if not response.ok:
             log.error("Authentication failed: %s", response.text)
-            raise RuntimeError("WithSecure authentication failed")
+            raise ApiError.from_response(
+                response,
+                "WithSecure authentication failed"
+            )
 
-        self._token = response.json()["access_token"]
+        payload = response.json()
+        self._token = payload["access_token"]
+        self._expires_at = time.monotonic() + max(
+            0, int(payload.get("expires_in", 3600)) - TOKEN_REFRESH_MARGIN
+        )
         log.debug("Authentication successful")
         return self._token
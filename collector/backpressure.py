@@ -0,0 +1,221 @@
+# collector/backpressure.py
+# VERSION: v1.0.0
+#
+# PURPOSE:
+# - Protege el disco del manager cuando Wazuh no alcanza a consumir
+# - Señales: espacio libre del volumen events/ y lag del consumidor
+#   (tamaño del archivo vs offset en file_status.json de logcollector)
+# - Niveles por tenant: normal -> throttle -> pause (con histéresis)
+# - Descarte opcional de eventos de bajo riesgo bajo presión
+# - Expone nivel, lag y descartes vía collector.metrics
+
+import json
+import logging
+import shutil
+import time
+from pathlib import Path
+
+from collector import metrics
+from collector.log_files import EVENTS_DIR
+from collector.normalizers import RISK_MAP
+
+log = logging.getLogger(__name__)
+
+NORMAL = "normal"
+THROTTLE = "throttle"
+PAUSE = "pause"
+
+LEVEL_VALUE = {NORMAL: 0, THROTTLE: 1, PAUSE: 2}
+
+# Orden de severidad (valores WithSecure y normalizados)
+RISK_ORDER = ["INFO", "LOW", "MEDIUM", "HIGH", "SEVERE", "CRITICAL"]
+RISK_RANK = {}
+for _rank, _risk in enumerate(RISK_ORDER):
+    RISK_RANK[_risk] = _rank
+    RISK_RANK[RISK_MAP[_risk]] = _rank
+
+
+class BackpressureController:
+    """
+    Evalúa la presión aguas abajo y decide, por tenant, si el fetch
+    continúa normal, se ralentiza o se pausa.
+    """
+
+    def __init__(self, settings: dict):
+        self.levels = {}
+        self._status_cache = {}
+        self._status_read_at = 0.0
+        self._disk_cache = None
+        self._disk_read_at = 0.0
+        self.configure(settings)
+
+    def configure(self, settings: dict):
+        """
+        Aplica la sección 'backpressure' (ya validada) de config.yml.
+        """
+        self.settings = settings
+        self._status_read_at = 0.0
+        self._disk_read_at = 0.0
+
+    # ------------------------------------------------------------------
+    # Signals
+    # ------------------------------------------------------------------
+    def _free_pct(self) -> float:
+        now = time.monotonic()
+        if (
+            self._disk_cache is None
+            or now - self._disk_read_at >= self.settings["check_interval"]
+        ):
+            EVENTS_DIR.mkdir(parents=True, exist_ok=True)
+            usage = shutil.disk_usage(EVENTS_DIR)
+            self._disk_cache = usage.free * 100.0 / usage.total
+            self._disk_read_at = now
+            metrics.set_gauge(
+                "withsecure_events_disk_free_percent",
+                round(self._disk_cache, 2)
+            )
+
+        return self._disk_cache
+
+    def _consumer_offsets(self) -> dict:
+        """
+        Lee file_status.json de Wazuh logcollector:
+        {"files": [{"path": "...", "hash": "...", "offset": "123"}]}
+        """
+        now = time.monotonic()
+        if now - self._status_read_at < self.settings["check_interval"]:
+            return self._status_cache
+
+        self._status_read_at = now
+        path = self.settings.get("wazuh_file_status")
+        if not path:
+            self._status_cache = {}
+            return self._status_cache
+
+        try:
+            data = json.loads(Path(path).read_text())
+            self._status_cache = {
+                str(Path(f["path"]).resolve()): int(f["offset"])
+                for f in data.get("files", [])
+                if "path" in f and "offset" in f
+            }
+        except FileNotFoundError:
+            self._status_cache = {}
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            log.debug("Unable to read Wazuh file_status (%s): %s", path, e)
+            self._status_cache = {}
+
+        return self._status_cache
+
+    def _lag_bytes(self, log_path: Path) -> int:
+        resolved = log_path.resolve()
+        offset = self._consumer_offsets().get(str(resolved))
+        if offset is None:
+            return 0
+
+        try:
+            size = resolved.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+        # Archivo rotado/truncado: el offset ya no aplica
+        return max(0, size - offset)
+
+    # ------------------------------------------------------------------
+    # Decision
+    # ------------------------------------------------------------------
+    def _next_level(self, current: str, free_pct: float, lag: int) -> str:
+        s = self.settings
+        h = s["hysteresis_pct"] / 100.0
+
+        level = NORMAL
+        if free_pct < s["min_free_pct_throttle"] or lag > s["max_lag_bytes_throttle"]:
+            level = THROTTLE
+        if free_pct < s["min_free_pct_pause"] or lag > s["max_lag_bytes_pause"]:
+            level = PAUSE
+
+        # Histéresis: sólo se baja de nivel cuando la señal se
+        # recupera con margen, evitando oscilaciones
+        if current == PAUSE and level != PAUSE:
+            if (
+                free_pct < s["min_free_pct_pause"] * (1 + h)
+                or lag > s["max_lag_bytes_pause"] * (1 - h)
+            ):
+                level = PAUSE
+
+        if current in (THROTTLE, PAUSE) and level == NORMAL:
+            if (
+                free_pct < s["min_free_pct_throttle"] * (1 + h)
+                or lag > s["max_lag_bytes_throttle"] * (1 - h)
+            ):
+                level = THROTTLE
+
+        return level
+
+    def evaluate(self, tenant: str, log_path: Path) -> str:
+        """
+        Devuelve el nivel actual del tenant (normal | throttle | pause).
+        """
+        if not self.settings["enabled"]:
+            return NORMAL
+
+        free_pct = self._free_pct()
+        lag = self._lag_bytes(log_path)
+
+        current = self.levels.get(tenant, NORMAL)
+        level = self._next_level(current, free_pct, lag)
+
+        if level != current:
+            log.warning(
+                "Backpressure for '%s': %s -> %s (disk_free=%.1f%% lag=%s bytes)",
+                tenant,
+                current,
+                level,
+                free_pct,
+                lag
+            )
+            metrics.inc("withsecure_backpressure_transitions_total", tenant=tenant)
+
+        self.levels[tenant] = level
+        metrics.set_gauge("withsecure_backpressure_level", LEVEL_VALUE[level], tenant=tenant)
+        metrics.set_gauge("withsecure_consumer_lag_bytes", lag, tenant=tenant)
+
+        return level
+
+    def interval_for(self, level: str, interval: int) -> float:
+        """
+        Intervalo efectivo de polling según el nivel.
+        """
+        if level == THROTTLE:
+            return interval * self.settings["throttle_factor"]
+        if level == PAUSE:
+            return max(interval, self.settings["check_interval"])
+        return interval
+
+    def shed(self, tenant: str, level: str, items: list) -> list:
+        """
+        Descarta eventos con riesgo inferior a 'shed_below_risk'
+        mientras el tenant esté bajo presión.
+        """
+        threshold = self.settings.get("shed_below_risk")
+        if not threshold or level == NORMAL:
+            return items
+
+        min_rank = RISK_RANK[threshold]
+        kept = []
+        for item in items:
+            details = item.get("withsecure", {}).get("details") or {}
+            rank = RISK_RANK.get(details.get("risk"))
+            if rank is None or rank >= min_rank:
+                kept.append(item)
+
+        dropped = len(items) - len(kept)
+        if dropped:
+            metrics.inc("withsecure_events_shed_total", dropped, tenant=tenant)
+            log.warning(
+                "Backpressure shed %s low-priority events for '%s'",
+                dropped,
+                tenant
+            )
+
+        return kept
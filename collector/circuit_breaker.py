@@ -0,0 +1,141 @@
+# collector/circuit_breaker.py
+# VERSION: v1.0.0
+#
+# PURPOSE:
+# - Circuit breaker por tenant: closed -> open -> half_open -> closed
+# - Clasifica errores por status HTTP real (auth, throttle, server, network)
+# - Backoff exponencial con jitter (evita reintentos sincronizados
+#   de toda la flota cuando la API vuelve)
+# - Expone estado y errores vía logs y collector.metrics
+
+import logging
+import random
+
+import requests
+
+from collector import metrics
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+AUTH = "auth"
+THROTTLE = "throttle"
+SERVER = "server"
+NETWORK = "network"
+CLIENT = "client"
+
+# Los errores de credencial no se arreglan solos: backoff más largo
+AUTH_DELAY_FACTOR = 10
+
+
+def classify(error) -> str:
+    """
+    Clasifica una excepción de fetch / autenticación.
+    """
+    if isinstance(error, requests.RequestException):
+        return NETWORK
+
+    status = getattr(error, "status_code", None)
+    if status in (401, 403):
+        return AUTH
+    if status == 429:
+        return THROTTLE
+    if status is None or status >= 500:
+        return SERVER
+    return CLIENT
+
+
+class CircuitBreaker:
+    def __init__(self, tenant: str, settings: dict):
+        self.tenant = tenant
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = 0.0
+        self.configure(settings)
+        self._publish()
+
+    def configure(self, settings: dict):
+        """
+        Aplica la sección 'circuit_breaker' (ya validada) de config.yml.
+        """
+        self.failure_threshold = settings["failure_threshold"]
+        self.base_delay = settings["base_delay"]
+        self.max_delay = settings["max_delay"]
+
+    def _publish(self):
+        metrics.set_gauge(
+            "withsecure_circuit_state",
+            STATE_VALUE[self.state],
+            tenant=self.tenant
+        )
+
+    def _transition(self, state: str, reason: str = ""):
+        if state == self.state:
+            return
+
+        level = logging.INFO if state != OPEN else logging.WARNING
+        log.log(
+            level,
+            "Circuit for '%s': %s -> %s%s",
+            self.tenant,
+            self.state,
+            state,
+            f" ({reason})" if reason else ""
+        )
+        self.state = state
+        self._publish()
+
+    def allow(self, now: float) -> bool:
+        """
+        True si el tenant puede consultar la API ahora.
+        Al vencer el backoff se deja pasar una sonda (half_open).
+        """
+        if self.state == OPEN:
+            if now < self.retry_at:
+                return False
+            self._transition(HALF_OPEN, "probing")
+        return True
+
+    def _backoff(self, kind: str) -> float:
+        exponent = max(0, self.failures - self.failure_threshold)
+        base = self.base_delay * (AUTH_DELAY_FACTOR if kind == AUTH else 1)
+        cap = min(self.max_delay, base * (2 ** exponent))
+        # Equal jitter: nunca menos de la mitad, nunca sincronizado
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def record_success(self):
+        if self.failures or self.state != CLOSED:
+            self._transition(CLOSED, "request succeeded")
+        self.failures = 0
+
+    def record_failure(self, error, now: float) -> float:
+        """
+        Registra un fallo. Devuelve los segundos hasta el próximo
+        intento si el circuito queda abierto, o 0 si sigue cerrado.
+        """
+        kind = classify(error)
+        self.failures += 1
+        metrics.inc("withsecure_api_errors_total", tenant=self.tenant, kind=kind)
+
+        opens = (
+            kind in (AUTH, THROTTLE)
+            or self.state == HALF_OPEN
+            or self.failures >= self.failure_threshold
+        )
+
+        if not opens:
+            return 0.0
+
+        delay = self._backoff(kind)
+        retry_after = getattr(error, "retry_after", None)
+        if kind == THROTTLE and retry_after:
+            delay = max(delay, retry_after)
+
+        self.retry_at = now + delay
+        self._transition(OPEN, f"{kind} error, retry in {delay:.0f}s")
+        return delay
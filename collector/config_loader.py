@@ -1,7 +1,14 @@
 # collector/config_loader.py
-# VERSION: v1.3.1
+# VERSION: v1.8.1
 #
 # CHANGELOG:
+# - start_date debe ser un timestamp ISO 8601 / epoch parseable
+# - NEW: sección global 'circuit_breaker' con defaults y validación
+# - NEW: shutdown_drain_seconds global (default 5)
+# - NEW: sección 'credentials' (credenciales compartidas entre tenants)
+# - NEW: 'credential' y 'weight' por cliente
+# - NEW: sección global 'backpressure' con defaults y validación
+# - NEW: enrichment / enrichment_ttl / enrichment_negative_ttl por cliente
 # - Mantiene hot-reload REAL usando mtime
 # - Cachea configuración en memoria
 # - Valida estructura multi-tenant
@@ -16,6 +23,8 @@ def load_config():
     import logging
     from pathlib import Path
 
+    from collector.timestamps import to_epoch_us
+
     log = logging.getLogger(__name__)
 
     # ------------------------------------------------------------
@@ -53,11 +62,34 @@ def load_config():
         # --------------------------------------------------------
         required_fields = [
             "name",
-            "client_id",
-            "client_secret",
             "interval",
         ]
 
+        # --------------------------------------------------------
+        # NEW: shared credentials (MSSP)
+        # --------------------------------------------------------
+        credentials = config.get("credentials") or {}
+        if not isinstance(credentials, dict):
+            raise ValueError("'credentials' must be a mapping")
+
+        for cred_name, cred in credentials.items():
+            for field in ("client_id", "client_secret"):
+                if not isinstance(cred, dict) or field not in cred:
+                    raise ValueError(
+                        f"Missing '{field}' in credentials.{cred_name}"
+                    )
+
+            cred.setdefault("rate_limit_per_minute", 60)
+            if (
+                not isinstance(cred["rate_limit_per_minute"], int)
+                or cred["rate_limit_per_minute"] <= 0
+            ):
+                raise ValueError(
+                    f"Invalid rate_limit_per_minute in credentials.{cred_name}"
+                )
+
+        config["credentials"] = credentials
+
         for idx, client in enumerate(config["clients"]):
             # --------------------------------------------
             # Mandatory fields
@@ -68,6 +100,37 @@ def load_config():
                         f"Missing '{field}' in clients[{idx}]"
                     )
 
+            # --------------------------------------------
+            # NEW: credential (shared) or inline client_id/secret
+            # --------------------------------------------
+            if "credential" in client:
+                cred_name = client["credential"]
+                if cred_name not in credentials:
+                    raise ValueError(
+                        f"Unknown credential '{cred_name}' in clients[{idx}]"
+                    )
+                client["client_id"] = credentials[cred_name]["client_id"]
+                client["client_secret"] = credentials[cred_name]["client_secret"]
+                client["credential_key"] = f"credential:{cred_name}"
+
+            else:
+                for field in ("client_id", "client_secret"):
+                    if field not in client:
+                        raise ValueError(
+                            f"Missing '{field}' in clients[{idx}]"
+                        )
+                # Entradas inline con el mismo client_id comparten grupo
+                client["credential_key"] = f"inline:{client['client_id']}"
+
+            client.setdefault("weight", 1)
+            if (
+                not isinstance(client["weight"], (int, float))
+                or client["weight"] <= 0
+            ):
+                raise ValueError(
+                    f"Invalid weight in clients[{idx}]"
+                )
+
             # --------------------------------------------
             # Optional: rate-limit per tenant
             # --------------------------------------------
@@ -99,6 +162,156 @@ def load_config():
                         f"start_date required when start_mode='fixed' in clients[{idx}]"
                     )
 
+                if to_epoch_us(client["start_date"]) is None:
+                    raise ValueError(
+                        f"Invalid start_date in clients[{idx}]"
+                    )
+
+            # --------------------------------------------
+            # NEW: enrichment (device / organization)
+            # --------------------------------------------
+            client.setdefault("enrichment", False)
+            client.setdefault("enrichment_ttl", 3600)
+            client.setdefault("enrichment_negative_ttl", 300)
+            client.setdefault("enrichment_max_entries", 5000)
+
+            if not isinstance(client["enrichment"], bool):
+                raise ValueError(
+                    f"Invalid enrichment in clients[{idx}]"
+                )
+
+            for field in (
+                "enrichment_ttl",
+                "enrichment_negative_ttl",
+                "enrichment_max_entries",
+            ):
+                if not isinstance(client[field], int) or client[field] <= 0:
+                    raise ValueError(
+                        f"Invalid {field} in clients[{idx}]"
+                    )
+
+        # --------------------------------------------------------
+        # Rate budget per credential group
+        # - credential: rate_limit_per_minute de la credencial
+        # - inline: el menor rate_limit_per_minute del grupo
+        # --------------------------------------------------------
+        group_rates = {}
+        for client in config["clients"]:
+            key = client["credential_key"]
+            if "credential" in client:
+                rate = credentials[client["credential"]]["rate_limit_per_minute"]
+            else:
+                rate = min(
+                    group_rates.get(key, client["rate_limit_per_minute"]),
+                    client["rate_limit_per_minute"]
+                )
+            group_rates[key] = rate
+
+        for client in config["clients"]:
+            client["credential_rate_limit_per_minute"] = (
+                group_rates[client["credential_key"]]
+            )
+
+        # --------------------------------------------------------
+        # NEW: backpressure (global)
+        # --------------------------------------------------------
+        backpressure_defaults = {
+            "enabled": True,
+            "check_interval": 5,
+            "min_free_pct_throttle": 15,
+            "min_free_pct_pause": 5,
+            "max_lag_bytes_throttle": 256 * 1024 * 1024,
+            "max_lag_bytes_pause": 1024 * 1024 * 1024,
+            "hysteresis_pct": 20,
+            "throttle_factor": 4,
+            "shed_below_risk": None,
+            "wazuh_file_status": "/var/ossec/queue/logcollector/file_status.json",
+        }
+
+        backpressure = config.get("backpressure") or {}
+        if not isinstance(backpressure, dict):
+            raise ValueError("'backpressure' must be a mapping")
+
+        for key in backpressure:
+            if key not in backpressure_defaults:
+                raise ValueError(f"Unknown backpressure option '{key}'")
+
+        backpressure = {**backpressure_defaults, **backpressure}
+
+        for key in (
+            "check_interval",
+            "min_free_pct_throttle",
+            "min_free_pct_pause",
+            "max_lag_bytes_throttle",
+            "max_lag_bytes_pause",
+            "hysteresis_pct",
+            "throttle_factor",
+        ):
+            if (
+                not isinstance(backpressure[key], (int, float))
+                or backpressure[key] <= 0
+            ):
+                raise ValueError(f"Invalid backpressure.{key}")
+
+        if backpressure["min_free_pct_pause"] > backpressure["min_free_pct_throttle"]:
+            raise ValueError(
+                "backpressure.min_free_pct_pause must be <= min_free_pct_throttle"
+            )
+
+        if backpressure["max_lag_bytes_pause"] < backpressure["max_lag_bytes_throttle"]:
+            raise ValueError(
+                "backpressure.max_lag_bytes_pause must be >= max_lag_bytes_throttle"
+            )
+
+        if backpressure["shed_below_risk"] not in (
+            None, "LOW", "MEDIUM", "HIGH", "SEVERE", "CRITICAL"
+        ):
+            raise ValueError("Invalid backpressure.shed_below_risk")
+
+        config["backpressure"] = backpressure
+
+        # --------------------------------------------------------
+        # NEW: circuit breaker (global)
+        # --------------------------------------------------------
+        breaker_defaults = {
+            "failure_threshold": 3,
+            "base_delay": 30,
+            "max_delay": 3600,
+        }
+
+        breaker = config.get("circuit_breaker") or {}
+        if not isinstance(breaker, dict):
+            raise ValueError("'circuit_breaker' must be a mapping")
+
+        for key in breaker:
+            if key not in breaker_defaults:
+                raise ValueError(f"Unknown circuit_breaker option '{key}'")
+
+        breaker = {**breaker_defaults, **breaker}
+
+        for key in breaker_defaults:
+            if (
+                not isinstance(breaker[key], (int, float))
+                or breaker[key] <= 0
+            ):
+                raise ValueError(f"Invalid circuit_breaker.{key}")
+
+        if breaker["base_delay"] > breaker["max_delay"]:
+            raise ValueError("circuit_breaker.base_delay must be <= max_delay")
+
+        config["circuit_breaker"] = breaker
+
+        # --------------------------------------------------------
+        # NEW: shutdown drain deadline (global)
+        # --------------------------------------------------------
+        config.setdefault("shutdown_drain_seconds", 5)
+
+        if (
+            not isinstance(config["shutdown_drain_seconds"], (int, float))
+            or config["shutdown_drain_seconds"] <= 0
+        ):
+            raise ValueError("Invalid shutdown_drain_seconds")
+
         # --------------------------------------------------------
         # Update cache
         # --------------------------------------------------------
@@ -0,0 +1,158 @@
+# collector/credentials.py
+# VERSION: v1.0.1
+#
+# FIX:
+# - Un 429 bloquea el budget de toda la credencial (block_until)
+#
+# PURPOSE:
+# - Agrupa tenants que comparten credencial WithSecure (MSSP)
+# - Un token, un pool de conexiones y un rate budget por credencial
+# - El budget se reparte entre organizaciones según 'weight'
+# - Los grupos sobreviven al hot-reload (un token por credencial)
+
+import logging
+import time
+
+import requests
+
+from collector.authentication import WithSecureAuth
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------
+# Token bucket por tenant dentro del grupo
+# ----------------------------------------------------------------------
+class RateBudget:
+    """
+    Reparte 'rate_limit_per_minute' de la credencial entre sus
+    tenants proporcionalmente a su peso. No bloquea: acquire()
+    devuelve los segundos a esperar si no hay presupuesto.
+    """
+
+    def __init__(self, rate_limit_per_minute: int):
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.weights = {}
+        self._buckets = {}
+        self._blocked_until = 0.0
+
+    def set_weights(self, weights: dict):
+        self.weights = dict(weights)
+        for tenant in list(self._buckets):
+            if tenant not in self.weights:
+                del self._buckets[tenant]
+
+    def share(self, tenant: str) -> float:
+        """
+        Requests por minuto asignados al tenant.
+        """
+        total = sum(self.weights.values())
+        if not total or tenant not in self.weights:
+            return float(self.rate_limit_per_minute)
+        return self.rate_limit_per_minute * self.weights[tenant] / total
+
+    def block_until(self, until: float):
+        """
+        Bloquea el presupuesto de todo el grupo hasta 'until'
+        (time.monotonic). Usado ante un 429: el límite es de la
+        credencial, no del tenant que lo recibió.
+        """
+        self._blocked_until = max(self._blocked_until, until)
+
+    def acquire(self, tenant: str) -> float:
+        capacity = max(1.0, self.share(tenant))
+        rate = capacity / 60.0
+        now = time.monotonic()
+
+        if now < self._blocked_until:
+            return self._blocked_until - now
+
+        tokens, updated = self._buckets.get(tenant, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+
+        if tokens >= 1.0:
+            self._buckets[tenant] = (tokens - 1.0, now)
+            return 0.0
+
+        self._buckets[tenant] = (tokens, now)
+        return (1.0 - tokens) / rate
+
+
+# ----------------------------------------------------------------------
+# Credential group
+# ----------------------------------------------------------------------
+class CredentialGroup:
+    def __init__(self, key: str, client_id: str, client_secret: str,
+                 rate_limit_per_minute: int):
+        self.key = key
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = requests.Session()
+        self.auth = WithSecureAuth(
+            client_id,
+            client_secret,
+            session=self.session
+        )
+        self.budget = RateBudget(rate_limit_per_minute)
+
+    def close(self):
+        self.session.close()
+
+
+class CredentialRegistry:
+    """
+    Mantiene los grupos de credenciales entre recargas de config.yml.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self._tenants = {}
+
+    def sync(self, config: dict):
+        """
+        Reconstruye el mapeo tenant -> grupo a partir de la config
+        validada. Reutiliza grupos (y su token) si la credencial
+        no cambió.
+        """
+        wanted = {}
+        members = {}
+
+        for client in config["clients"]:
+            key = client["credential_key"]
+            wanted[key] = (
+                client["client_id"],
+                client["client_secret"],
+                client["credential_rate_limit_per_minute"],
+            )
+            members.setdefault(key, {})[client["name"]] = client["weight"]
+
+        for key in list(self.groups):
+            group = self.groups[key]
+            if (
+                key not in wanted
+                or wanted[key][:2] != (group.client_id, group.client_secret)
+            ):
+                group.close()
+                del self.groups[key]
+
+        for key, (client_id, client_secret, rate) in wanted.items():
+            group = self.groups.get(key)
+            if group is None:
+                group = CredentialGroup(key, client_id, client_secret, rate)
+                self.groups[key] = group
+                log.info(
+                    "Credential group '%s' created (%s tenants)",
+                    key,
+                    len(members[key])
+                )
+            group.budget.rate_limit_per_minute = rate
+            group.budget.set_weights(members[key])
+
+        self._tenants = {
+            name: self.groups[key]
+            for key, tenants in members.items()
+            for name in tenants
+        }
+
+    def for_tenant(self, name: str) -> CredentialGroup:
+        return self._tenants[name]
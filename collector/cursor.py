@@ -0,0 +1,120 @@
+# collector/cursor.py
+# VERSION: v1.0.0
+#
+# PURPOSE:
+# - Cursor de paginación por tenant sobre persistenceTimestamp
+# - Parsea cada timestamp una sola vez a epoch-us (int)
+# - Verifica el orden en una pasada O(n); ordena sólo si la página
+#   llega desordenada (la request ya pide order=asc)
+# - Watermark monotónico + tie-set (IDs ya entregados con el mismo
+#   timestamp) para un cursor exacto entre ciclos; requiere que la
+#   request pida exclusiveStart=false (inicio inclusivo)
+# - Sin comparaciones lexicográficas de strings ISO
+
+import logging
+
+from collector import metrics
+from collector.timestamps import from_epoch_us, to_epoch_us
+
+log = logging.getLogger(__name__)
+
+
+class Cursor:
+    def __init__(self, last_ts, tie_ids=()):
+        watermark = to_epoch_us(last_ts)
+        if watermark is None:
+            raise ValueError(f"Invalid cursor timestamp: {last_ts!r}")
+
+        self.watermark_us = watermark
+        self.tie_ids = set(tie_ids)
+        self.out_of_order_pages = 0
+
+    @property
+    def last_ts(self) -> str:
+        """
+        Watermark en formato canónico para persistenceTimestampStart.
+        """
+        return from_epoch_us(self.watermark_us)
+
+    def state(self) -> dict:
+        return {
+            "last_ts": self.last_ts,
+            "tie_ids": sorted(self.tie_ids),
+        }
+
+    def ingest(self, items: list, tenant: str = None) -> list:
+        """
+        Ordena (si hace falta) y deduplica una página de eventos
+        envueltos, y avanza el watermark. Devuelve la página lista
+        para guardar.
+        """
+        keys = []
+        stamped = []
+        ordered = True
+        previous = None
+
+        # ------------------------------------------------------------
+        # Una pasada: parseo + verificación de orden
+        # Eventos sin timestamp heredan el del anterior (conservan
+        # su posición relativa si hay que ordenar)
+        # ------------------------------------------------------------
+        for item in items:
+            ts = to_epoch_us(
+                item.get("withsecure", {}).get("persistenceTimestamp")
+            )
+            stamped.append(ts is not None)
+            if ts is None:
+                ts = previous if previous is not None else self.watermark_us
+            elif previous is not None and ts < previous:
+                ordered = False
+            keys.append(ts)
+            previous = ts
+
+        if not ordered:
+            self.out_of_order_pages += 1
+            metrics.inc("withsecure_out_of_order_pages_total", tenant=tenant)
+            log.debug(
+                "Out-of-order page for %s, sorting %s events",
+                tenant,
+                len(items),
+                extra={"tenant": tenant, "sample": True}
+            )
+            rows = sorted(
+                zip(keys, stamped, items),
+                key=lambda row: row[0]
+            )
+            keys = [row[0] for row in rows]
+            stamped = [row[1] for row in rows]
+            items = [row[2] for row in rows]
+
+        # ------------------------------------------------------------
+        # Dedupe contra el tie-set + avance del watermark
+        # ------------------------------------------------------------
+        page = []
+        watermark = self.watermark_us
+        ties = set(self.tie_ids)
+
+        for ts, has_ts, item in zip(keys, stamped, items):
+            if not has_ts:
+                page.append(item)
+                continue
+
+            event_id = item.get("withsecure", {}).get("id")
+
+            # Mismo timestamp que el cursor y ya entregado
+            if ts == self.watermark_us and event_id and event_id in self.tie_ids:
+                continue
+
+            if ts > watermark:
+                watermark = ts
+                ties = set()
+
+            if ts == watermark and event_id:
+                ties.add(event_id)
+
+            page.append(item)
+
+        self.watermark_us = watermark
+        self.tie_ids = ties
+
+        return page
@@ -0,0 +1,342 @@
+# collector/enrichment.py
+# VERSION: v1.0.2
+#
+# FIX:
+# - Backoff por endpoint tras un lookup fallido (403 sin permiso,
+#   5xx, red, budget agotado): no se repite la consulta en cada página
+# - 401 invalida el token (como fetch_events)
+# - Cada lookup consume el rate budget de la credencial; sin
+#   presupuesto la página se guarda sin enriquecer
+# - configure() re-aplica TTL / tamaño del cache en hot-reload
+# - Lookups de organizaciones en lote (como los de dispositivos)
+#
+# PURPOSE:
+# - Enriquece eventos con metadata de dispositivo y organización
+# - Resuelve IDs vía endpoints WithSecure devices / organizations
+# - Cache por tenant con TTL + LRU
+# - Lookups deduplicados y en lote por página
+# - Cache negativo para IDs que la API no devuelve
+# - Persiste el cache en state/ para sobrevivir reinicios
+
+import json
+import logging
+import time
+from collections import OrderedDict
+
+import requests
+
+from collector.authentication import ApiError, REQUEST_TIMEOUT
+from collector.state import STATE_DIR
+
+log = logging.getLogger(__name__)
+
+API_URL = "https://api.connect.withsecure.com"
+DEVICES_PATH = "/devices/v1/devices"
+ORGANIZATIONS_PATH = "/organizations/v1/organizations"
+
+# Máximo de IDs por request (límite de la API)
+DEVICE_BATCH_SIZE = 100
+ORGANIZATION_BATCH_SIZE = 100
+
+
+# ----------------------------------------------------------------------
+# TTL + LRU cache
+# ----------------------------------------------------------------------
+class TTLCache:
+    """
+    Cache LRU con expiración por entrada.
+    Un valor None representa un resultado negativo (ID inexistente).
+    Usa reloj de pared para que las expiraciones sean válidas
+    tras un reinicio.
+    """
+
+    def __init__(self, max_entries: int, ttl: int, negative_ttl: int):
+        self._data = OrderedDict()
+        self.configure(max_entries, ttl, negative_ttl)
+
+    def configure(self, max_entries: int, ttl: int, negative_ttl: int):
+        """
+        Aplica nuevos límites. Las entradas existentes conservan su
+        expiración; el exceso se descarta por LRU.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        """
+        Devuelve (hit, value). Las entradas expiradas cuentan como miss.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+
+        expires, value = entry
+        if expires <= time.time():
+            del self._data[key]
+            return False, None
+
+        self._data.move_to_end(key)
+        return True, value
+
+    def put(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def dump(self) -> list:
+        now = time.time()
+        return [
+            [key, expires, value]
+            for key, (expires, value) in self._data.items()
+            if expires > now
+        ]
+
+    def load(self, entries: list):
+        now = time.time()
+        for key, expires, value in entries:
+            if expires > now:
+                self._data[key] = (expires, value)
+
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+# ----------------------------------------------------------------------
+# Enricher
+# ----------------------------------------------------------------------
+class Enricher:
+    """
+    Etapa de enriquecimiento por tenant.
+    Añade al evento envuelto la clave "enrichment" con los datos
+    de dispositivo y organización resueltos.
+    """
+
+    def __init__(
+        self,
+        tenant: str,
+        auth,
+        budget=None,
+        ttl: int = 3600,
+        negative_ttl: int = 300,
+        max_entries: int = 5000,
+    ):
+        self.tenant = tenant
+        self.auth = auth
+        self.budget = budget
+        self.devices = TTLCache(max_entries, ttl, negative_ttl)
+        self.organizations = TTLCache(max_entries, ttl, negative_ttl)
+        self.path = STATE_DIR / f"{tenant}.enrichment.json"
+        self.api_calls = 0
+        self.error_backoff = negative_ttl
+        self._retry_at = {}
+        self._dirty = False
+
+        self._load()
+
+    def configure(self, ttl: int, negative_ttl: int, max_entries: int):
+        """
+        Re-aplica enrichment_* tras un hot-reload de config.yml.
+        """
+        self.devices.configure(max_entries, ttl, negative_ttl)
+        self.organizations.configure(max_entries, ttl, negative_ttl)
+        self.error_backoff = negative_ttl
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def _load(self):
+        if not self.path.exists():
+            return
+
+        try:
+            data = json.loads(self.path.read_text())
+            self.devices.load(data.get("devices", []))
+            self.organizations.load(data.get("organizations", []))
+        except (ValueError, TypeError) as e:
+            log.warning(
+                "Enrichment cache for '%s' ignored (corrupt): %s",
+                self.tenant,
+                e
+            )
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "devices": self.devices.dump(),
+            "organizations": self.organizations.dump(),
+        }))
+        tmp.replace(self.path)
+        self._dirty = False
+
+    # ------------------------------------------------------------------
+    # API lookups
+    # ------------------------------------------------------------------
+    def _available(self, path) -> bool:
+        return time.monotonic() >= self._retry_at.get(path, 0.0)
+
+    def _get(self, path, params):
+        """
+        GET a un endpoint de lookup. Si falla, el endpoint queda en
+        backoff (budget: hasta que haya presupuesto; resto de errores:
+        negative_ttl) y enrich() no lo vuelve a consultar hasta entonces.
+        """
+        if self.budget is not None:
+            wait = self.budget.acquire(self.tenant)
+            if wait > 0:
+                self._retry_at[path] = time.monotonic() + wait
+                raise RuntimeError(
+                    f"rate budget exhausted, retry in {wait:.1f}s"
+                )
+
+        headers = {
+            "Authorization": f"Bearer {self.auth.authenticate()}",
+            "Accept": "application/json",
+            "User-Agent": "innovare-siem-collector"
+        }
+
+        self.api_calls += 1
+        try:
+            resp = self.auth.session.get(
+                API_URL + path,
+                headers=headers,
+                params=params,
+                timeout=REQUEST_TIMEOUT
+            )
+        except requests.RequestException:
+            self._retry_at[path] = time.monotonic() + self.error_backoff
+            raise
+
+        if not resp.ok:
+            if resp.status_code == 401:
+                self.auth.invalidate()
+            self._retry_at[path] = time.monotonic() + self.error_backoff
+            raise ApiError.from_response(resp, "Enrichment lookup failed")
+
+        return resp.json().get("items", [])
+
+    def _lookup_devices(self, device_ids, org_id):
+        for i in range(0, len(device_ids), DEVICE_BATCH_SIZE):
+            batch = device_ids[i:i + DEVICE_BATCH_SIZE]
+
+            params = [("deviceId", d) for d in batch]
+            params.append(("limit", len(batch)))
+            if org_id:
+                params.append(("organizationId", org_id))
+
+            found = {}
+            for item in self._get(DEVICES_PATH, params):
+                os_info = item.get("os") or {}
+                found[item.get("id")] = {
+                    "name": item.get("name"),
+                    "type": item.get("type"),
+                    "os": os_info.get("name"),
+                    "osVersion": os_info.get("version"),
+                    "ipAddresses": item.get("ipAddresses"),
+                }
+
+            # IDs no devueltos -> cache negativo
+            for device_id in batch:
+                self.devices.put(device_id, found.get(device_id))
+
+            self._dirty = True
+
+    def _lookup_organizations(self, org_ids):
+        for i in range(0, len(org_ids), ORGANIZATION_BATCH_SIZE):
+            batch = org_ids[i:i + ORGANIZATION_BATCH_SIZE]
+
+            params = [("organizationId", o) for o in batch]
+            params.append(("limit", len(batch)))
+
+            found = {}
+            for item in self._get(ORGANIZATIONS_PATH, params):
+                found[item.get("id")] = {
+                    "name": item.get("name"),
+                    "type": item.get("type"),
+                }
+
+            # IDs no devueltos -> cache negativo
+            for org_id in batch:
+                self.organizations.put(org_id, found.get(org_id))
+
+            self._dirty = True
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def enrich(self, items: list, org_id=None):
+        """
+        Enriquece una página de eventos envueltos (in-place).
+        Los IDs se deduplican por página y sólo se consultan
+        los que no están en cache.
+        """
+        missing_devices = set()
+        missing_orgs = set()
+
+        for item in items:
+            ws = item.get("withsecure", {})
+            device_id = (ws.get("device") or {}).get("id")
+            event_org = (ws.get("organization") or {}).get("id")
+
+            if device_id and not self.devices.get(device_id)[0]:
+                missing_devices.add(device_id)
+
+            if event_org and not self.organizations.get(event_org)[0]:
+                missing_orgs.add(event_org)
+
+        lookups = (
+            (DEVICES_PATH, missing_devices,
+             lambda ids: self._lookup_devices(ids, org_id)),
+            (ORGANIZATIONS_PATH, missing_orgs, self._lookup_organizations),
+        )
+
+        for path, missing, lookup in lookups:
+            # Endpoint en backoff tras un fallo: la página va sin
+            # enriquecer en vez de repetir la consulta
+            if not missing or not self._available(path):
+                continue
+
+            try:
+                lookup(sorted(missing))
+            except (RuntimeError, requests.RequestException) as e:
+                # Sin cache negativo: los IDs se reintentan al vencer
+                # el backoff del endpoint
+                log.warning(
+                    "Enrichment skipped for '%s': %s",
+                    self.tenant,
+                    e,
+                    extra={"tenant": self.tenant, "sample": True}
+                )
+
+        for item in items:
+            ws = item.get("withsecure", {})
+            device_id = (ws.get("device") or {}).get("id")
+            event_org = (ws.get("organization") or {}).get("id")
+
+            enrichment = {}
+
+            if device_id:
+                hit, value = self.devices.get(device_id)
+                if hit and value:
+                    enrichment["device"] = value
+
+            if event_org:
+                hit, value = self.organizations.get(event_org)
+                if hit and value:
+                    enrichment["organization"] = value
+
+            if enrichment:
+                item["enrichment"] = enrichment
+
+        self.save()
+
+        return items
@@ -0,0 +1,159 @@
+# collector/event_index.py
+# VERSION: v1.1.0
+#
+# FIX:
+# - Índices asociados a su segmento por inode, no por nombre: siguen
+#   válidos tras cualquier número de rotaciones (.1 -> .2 -> ...)
+# - Índices huérfanos (segmento borrado) se eliminan
+#
+# PURPOSE:
+# - Índice temporal disperso junto a cada events/<cliente>.log
+# - Una línea por bloque escrito (página): offset, fin, min y max
+#   de persistenceTimestamp en epoch-us
+# - Cabecera con el inode del archivo: tras una rotación por rename
+#   el índice se retira como <log>.<inode>.idx
+# - Usado por collector.replay para saltar directo al rango pedido
+#
+# FORMATO (<log>.idx):
+#   # inode <n>
+#   <offset> <end> <min_us> <max_us>
+
+import logging
+import os
+import re
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".idx"
+
+
+def index_path(log_path: Path) -> Path:
+    return log_path.with_name(log_path.name + INDEX_SUFFIX)
+
+
+def _read_inode(idx: Path):
+    try:
+        with idx.open("r", encoding="utf-8") as fh:
+            header = fh.readline().split()
+    except FileNotFoundError:
+        return None
+
+    if len(header) == 3 and header[:2] == ["#", "inode"]:
+        return int(header[2])
+    return None
+
+
+def _segment_inodes(log_path: Path) -> set:
+    inodes = set()
+    for segment in log_path.parent.glob(log_path.name + "*"):
+        if segment.name.endswith(INDEX_SUFFIX):
+            continue
+        try:
+            inodes.add(segment.stat().st_ino)
+        except FileNotFoundError:
+            continue
+    return inodes
+
+
+def _indexes(log_path: Path) -> list:
+    """
+    Índices del archivo vivo y de todos sus segmentos rotados.
+    """
+    found = sorted(log_path.parent.glob(f"{log_path.name}.*{INDEX_SUFFIX}"))
+    live = index_path(log_path)
+    if live.exists():
+        found.insert(0, live)
+    return found
+
+
+def prune(log_path: Path):
+    """
+    Elimina los índices cuyo segmento (por inode) ya no existe.
+    """
+    inodes = _segment_inodes(log_path)
+    for idx in _indexes(log_path):
+        if _read_inode(idx) not in inodes:
+            idx.unlink(missing_ok=True)
+            log.info("Orphan event index removed: %s", idx)
+
+
+def _retire(log_path: Path, idx: Path, old_inode: int):
+    """
+    El índice vivo pertenece a un segmento ya rotado: se renombra a
+    <log>.<inode>.idx. El nombre no depende del número de rotación,
+    el segmento se localiza siempre por inode.
+    """
+    idx.replace(log_path.with_name(f"{log_path.name}.{old_inode}{INDEX_SUFFIX}"))
+    prune(log_path)
+
+
+def base_log(segment: Path) -> Path:
+    """
+    Archivo vivo de un segmento (c.log.2 -> c.log).
+    """
+    m = re.match(r"^(.*?\.log)(?:[.-].*)?$", segment.name)
+    return segment.with_name(m.group(1) if m else segment.name)
+
+
+def find_index(segment: Path):
+    """
+    Índice cuyo inode de cabecera coincide con el del segmento.
+    """
+    inode = os.stat(segment).st_ino
+    for idx in _indexes(base_log(segment)):
+        if _read_inode(idx) == inode:
+            return idx
+    return None
+
+
+def append_block(log_path: Path, offset: int, end: int, min_us: int, max_us: int):
+    """
+    Registra un bloque [offset, end) escrito en log_path.
+    """
+    idx = index_path(log_path)
+    inode = os.stat(log_path).st_ino
+
+    current = _read_inode(idx)
+    if current is not None and current != inode:
+        _retire(log_path, idx, current)
+        current = None
+
+    # copytruncate: mismo inode, archivo reiniciado
+    if current is not None and offset == 0:
+        idx.unlink(missing_ok=True)
+        current = None
+
+    # Inode reutilizado por el sistema de archivos: un índice retirado
+    # con ese inode pertenece a un segmento ya borrado
+    if current is None:
+        for stale in _indexes(log_path):
+            if stale != idx and _read_inode(stale) == inode:
+                stale.unlink(missing_ok=True)
+                log.info("Stale event index removed (inode reused): %s", stale)
+
+    with idx.open("a", encoding="utf-8") as fh:
+        if current is None:
+            fh.write(f"# inode {inode}\n")
+        fh.write(f"{offset} {end} {min_us} {max_us}\n")
+
+
+def load_blocks(log_path: Path):
+    """
+    Devuelve la lista de bloques (offset, end, min_us, max_us) del
+    índice cuyo inode coincide con el archivo, o None si no hay.
+    """
+    idx = find_index(log_path)
+    if idx is None:
+        return None
+
+    blocks = []
+    with idx.open("r", encoding="utf-8") as fh:
+        fh.readline()
+        for line in fh:
+            parts = line.split()
+            if len(parts) != 4:
+                continue
+            blocks.append(tuple(int(p) for p in parts))
+
+    return blocks
@@ -1,15 +1,28 @@
 # collector/logger.py
-# VERSION: v1.3.0
+# VERSION: v1.4.1
 #
 # CHANGELOG:
+# - FIX: stop_logger() no falla ni se cuelga con la cola llena
+# - FIX: la traza de excepciones viaja aparte (campo JSON "exception")
+# - NEW: emisión no bloqueante (QueueHandler + QueueListener)
+# - NEW: cola acotada, descarta y cuenta registros si se llena
+# - NEW: muestreo por tenant para mensajes de hot-path (extra sample=True)
+# - NEW: salida JSON opcional (LOG_FORMAT=json) con tenant/page/duration
+# - NEW: rotación por tamaño (LOG_MAX_BYTES / LOG_BACKUP_COUNT)
 # - DEBUG siempre se guarda en logs/withsecure-collector.log
 # - Consola muestra INFO+ por defecto
 # - DEBUG en consola solo si DEBUG=1
 # - Mantiene filename en el LOG
 
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import time
 from pathlib import Path
 
 LOG_DIR = Path("logs")
@@ -17,6 +30,16 @@ LOG_DIR.mkdir(exist_ok=True)
 
 LOG_FILE = LOG_DIR / "withsecure-collector.log"
 
+# Campos estructurados aceptados vía extra={...}
+STRUCTURED_FIELDS = ("tenant", "page", "duration")
+
+# Tiempo máximo (segundos) para vaciar la cola al detener el listener
+STOP_TIMEOUT = 2.0
+
+_listener = None
+_queue_handler = None
+
+
 class LevelBasedStreamHandler(logging.StreamHandler):
     def emit(self, record):
         if record.levelno >= logging.WARNING:
@@ -24,26 +47,169 @@ class LevelBasedStreamHandler(logging.StreamHandler):
         else:
             self.stream = sys.stdout
         super().emit(record)
-        
+
+
+# ----------------------------------------------------------------------
+# Non-blocking queue handler
+# ----------------------------------------------------------------------
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca bloquea el hilo de polling: si la cola
+    está llena el registro se descarta y se contabiliza.
+    """
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        """
+        Igual que QueueHandler.prepare pero conserva la traza en
+        exc_text (el formatter de texto la añade al mensaje y el JSON
+        la emite en "exception").
+        """
+        exc_text = record.exc_text
+        if record.exc_info:
+            exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+
+_EXC_FORMATTER = logging.Formatter()
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener cuyo stop() nunca bloquea indefinidamente: si la
+    cola está llena descarta los registros más antiguos para hacer
+    sitio al sentinel, y espera al hilo como máximo STOP_TIMEOUT.
+    """
+
+    def enqueue_sentinel(self):
+        while True:
+            try:
+                self.queue.put(self._sentinel, timeout=STOP_TIMEOUT)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.enqueue_sentinel()
+        self._thread.join(STOP_TIMEOUT)
+        self._thread = None
+
+
+# ----------------------------------------------------------------------
+# Per-tenant sampling
+# ----------------------------------------------------------------------
+class TenantSamplingFilter(logging.Filter):
+    """
+    Limita los registros marcados con extra={"sample": True} a
+    'burst' por ventana de 'window' segundos y por (tenant, mensaje).
+    El primer registro de la siguiente ventana informa cuántos
+    se suprimieron.
+    """
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._windows = {}
+
+    def filter(self, record):
+        if not getattr(record, "sample", False):
+            return True
+
+        key = (getattr(record, "tenant", None), record.msg)
+        now = time.monotonic()
+        start, count, suppressed = self._windows.get(key, (now, 0, 0))
+
+        if now - start >= self.window:
+            start, count = now, 0
+
+        if count >= self.burst:
+            self._windows[key] = (start, count, suppressed + 1)
+            return False
+
+        if suppressed:
+            record.msg = f"{record.msg} (+{suppressed} similar suppressed)"
+
+        self._windows[key] = (start, count + 1, 0)
+        return True
+
+
+# ----------------------------------------------------------------------
+# JSON formatter
+# ----------------------------------------------------------------------
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "file": record.filename,
+            "message": record.getMessage(),
+        }
+
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
 def setup_logger():
     # ------------------------------------------------------------
     # Root logger
     # ------------------------------------------------------------
+    global _listener, _queue_handler
+
     root = logging.getLogger()
     root.setLevel(logging.DEBUG)  # capturamos TODO
 
     # ------------------------------------------------------------
-    # Formatter
+    # Avoid duplicate handlers on reload
     # ------------------------------------------------------------
-    formatter = logging.Formatter(
-        "%(asctime)s [%(levelname)s] %(filename)s: %(message)s"
-    )
+    if root.handlers:
+        return
+
+    # ------------------------------------------------------------
+    # Formatter (texto por defecto, JSON con LOG_FORMAT=json)
+    # ------------------------------------------------------------
+    if os.getenv("LOG_FORMAT", "text") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            "%(asctime)s [%(levelname)s] %(filename)s: %(message)s"
+        )
 
     # ------------------------------------------------------------
-    # File handler (DEBUG → archivo)
+    # File handler (DEBUG → archivo, rotación por tamaño)
     # ------------------------------------------------------------
-    file_handler = logging.FileHandler(
+    file_handler = logging.handlers.RotatingFileHandler(
         LOG_FILE,
+        maxBytes=int(os.getenv("LOG_MAX_BYTES", 50 * 1024 * 1024)),
+        backupCount=int(os.getenv("LOG_BACKUP_COUNT", 5)),
         encoding="utf-8"
     )
     file_handler.setLevel(logging.DEBUG)
@@ -61,8 +227,43 @@ def setup_logger():
     console_handler.setFormatter(formatter)
 
     # ------------------------------------------------------------
-    # Avoid duplicate handlers on reload
+    # Queue: el hilo de polling sólo encola, la E/S va en
+    # el hilo del listener
     # ------------------------------------------------------------
-    if not root.handlers:
-        root.addHandler(file_handler)
-        root.addHandler(console_handler)
+    log_queue = queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(TenantSamplingFilter(
+        burst=int(os.getenv("LOG_SAMPLE_BURST", 5)),
+        window=float(os.getenv("LOG_SAMPLE_WINDOW", 60)),
+    ))
+
+    _listener = DrainingQueueListener(
+        log_queue,
+        file_handler,
+        console_handler,
+        respect_handler_level=True
+    )
+    _listener.start()
+
+    _queue_handler = queue_handler
+    root.addHandler(queue_handler)
+    atexit.register(stop_logger)
+
+
+def dropped_records() -> int:
+    """
+    Registros descartados por cola llena desde el arranque.
+    """
+    return _queue_handler.dropped if _queue_handler else 0
+
+
+def stop_logger():
+    """
+    Vacía la cola y detiene el listener (idempotente).
+    """
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,25 +1,50 @@
 # collector/main.py
-# VERSION: v1.3.3
+# VERSION: v1.9.2
 #
 # FIXES / IMPROVEMENTS:
+# - FIX: un 429 bloquea el rate budget de toda la credencial
+# - FIX: sin rate budget el tenant se reprograma para cuando haya
+#   presupuesto (no cada interval)
+# - FIX: el signal handler ya no escribe logs (posible deadlock en la
+#   cola); os._exit del drain siempre se ejecuta (finally)
+# - NEW: cursor con watermark en epoch-us + tie-set (sin sort por página
+#   ni comparación de strings ISO)
+# - NEW: circuit breaker por tenant con backoff exponencial + jitter
+#   (reemplaza la detección de 429 por texto)
+# - Logs de polling con campos tenant / page / duration
+# - NEW: esperas interrumpibles (threading.Event) ante SIGTERM / SIGINT
+# - NEW: checkpoint de last_ts / anchor después de cada página
+# - NEW: shutdown_drain_seconds como límite duro del apagado
+# - NEW: grupos de credencial compartida (token, pool y rate budget)
+# - NEW: backpressure por disco / lag de Wazuh (throttle, pause, shed)
+# - NEW: exporta métricas en metrics/withsecure-collector.prom
+# - NEW: enriquecimiento opcional con cache por tenant (device / organization)
 # - Inicializa archivos de logs antes del polling (Wazuh-safe)
 # - Refactor menor para mejorar legibilidad
 # - Mantiene protección contra timestamps repetidos
-# - Mantiene state, anchor y exclusiveStart=true
+# - Mantiene state y anchor; exclusiveStart=false (dedupe por tie-set)
 
+import os
 import time
 import logging
 import signal
+import threading
+import requests
 from datetime import datetime, timezone
 from pathlib import Path
 
-from collector.logger import setup_logger
-from collector.authentication import WithSecureAuth
+from collector.logger import setup_logger, stop_logger, dropped_records
+from collector.credentials import CredentialRegistry
 from collector.api_client import fetch_events
 from collector.state import load_state, save_state
 from collector.save_events import save_events
 from collector.config_loader import load_config
 from collector.log_files import ensure_client_log
+from collector.enrichment import Enricher
+from collector.circuit_breaker import CircuitBreaker, THROTTLE, classify
+from collector.cursor import Cursor
+from collector.backpressure import BackpressureController, NORMAL, PAUSE
+from collector import metrics
 
 # --------------------------------------------------------------------
 # Logging
@@ -32,16 +57,44 @@ CONFIG_PATH = Path("config.yml")
 # --------------------------------------------------------------------
 # Graceful shutdown
 # --------------------------------------------------------------------
-shutdown_requested = False
+# - shutdown_event despierta inmediatamente cualquier espera
+# - la paginación se corta entre páginas (state ya guardado por página)
+# - si el request en curso no termina en shutdown_drain_seconds,
+#   se fuerza la salida: el último checkpoint ya está en disco
+# --------------------------------------------------------------------
+shutdown_event = threading.Event()
+shutdown_drain_seconds = 5
+shutdown_signal = None
+
+
+def _drain_expired():
+    try:
+        log.error(
+            "Shutdown drain deadline (%ss) exceeded, forcing exit",
+            shutdown_drain_seconds
+        )
+        stop_logger()
+        logging.shutdown()
+    finally:
+        os._exit(0)
 
 
 def handle_shutdown(signum, frame):
-    global shutdown_requested
-    shutdown_requested = True
-    log.warning(
-        "Shutdown signal received (%s). Finishing current cycle...",
-        signum
-    )
+    # Sin logging aquí: el handler puede interrumpir al hilo principal
+    # dentro de la cola de logs (lock no reentrante). Se registra
+    # desde el loop principal.
+    global shutdown_signal
+
+    if shutdown_event.is_set():
+        threading.Thread(target=_drain_expired, daemon=True).start()
+        return
+
+    shutdown_signal = signum
+    shutdown_event.set()
+
+    timer = threading.Timer(shutdown_drain_seconds, _drain_expired)
+    timer.daemon = True
+    timer.start()
 
 
 signal.signal(signal.SIGINT, handle_shutdown)
@@ -58,14 +111,18 @@ def utc_now_iso():
 # MAIN
 # --------------------------------------------------------------------
 def main():
+    global shutdown_drain_seconds
+
     log.info("WithSecure Events Collector started")
 
     # Estado del scheduler por cliente
     sched = {}
     last_config_mtime = None
     config = None
+    backpressure = None
+    credentials = CredentialRegistry()
 
-    while not shutdown_requested:
+    while not shutdown_event.is_set():
         now = time.monotonic()
 
         # ========================================================
@@ -75,13 +132,22 @@ def main():
             mtime = CONFIG_PATH.stat().st_mtime
         except FileNotFoundError:
             log.error("config.yml not found")
-            time.sleep(5)
+            shutdown_event.wait(5)
             continue
 
         if last_config_mtime != mtime:
             log.info("Reloading config.yml")
             config = load_config()
             last_config_mtime = mtime
+            shutdown_drain_seconds = config["shutdown_drain_seconds"]
+
+            if backpressure is None:
+                backpressure = BackpressureController(config["backpressure"])
+            else:
+                backpressure.configure(config["backpressure"])
+
+            # Un token / pool / budget por credencial (no por tenant)
+            credentials.sync(config)
 
             for client in config["clients"]:
                 name = client["name"]
@@ -91,18 +157,51 @@ def main():
                     # Wazuh requirement:
                     # El archivo debe existir ANTES de escribir eventos
                     # ------------------------------------------------
-                    ensure_client_log(name)
+                    log_path = ensure_client_log(name)
 
                     sched[name] = {
                         "next_run": 0.0,
-                        "auth": WithSecureAuth(
-                            client["client_id"],
-                            client["client_secret"]
+                        "log_path": log_path,
+                        "breaker": CircuitBreaker(
+                            name,
+                            config["circuit_breaker"]
                         ),
-                        "rate_limit_until": 0.0,
                         "start_initialized": False,
+                        "enricher": None,
                     }
 
+                else:
+                    sched[name]["breaker"].configure(config["circuit_breaker"])
+
+                group = credentials.for_tenant(name)
+                sched[name]["group"] = group
+                sched[name]["auth"] = group.auth
+
+                # ------------------------------------------------
+                # Enrichment (re-evaluado en cada reload)
+                # ------------------------------------------------
+                if not client["enrichment"]:
+                    sched[name]["enricher"] = None
+
+                elif sched[name]["enricher"] is None:
+                    sched[name]["enricher"] = Enricher(
+                        name,
+                        sched[name]["auth"],
+                        budget=group.budget,
+                        ttl=client["enrichment_ttl"],
+                        negative_ttl=client["enrichment_negative_ttl"],
+                        max_entries=client["enrichment_max_entries"],
+                    )
+
+                else:
+                    sched[name]["enricher"].auth = sched[name]["auth"]
+                    sched[name]["enricher"].budget = group.budget
+                    sched[name]["enricher"].configure(
+                        ttl=client["enrichment_ttl"],
+                        negative_ttl=client["enrichment_negative_ttl"],
+                        max_entries=client["enrichment_max_entries"],
+                    )
+
         # ========================================================
         # Seleccionar cliente listo para ejecutar
         # ========================================================
@@ -119,7 +218,7 @@ def main():
                 next_time = sched[name]["next_run"]
 
         if not next_client:
-            time.sleep(max(0.1, next_time - now))
+            shutdown_event.wait(max(0.1, next_time - now))
             continue
 
         # ========================================================
@@ -128,10 +227,28 @@ def main():
         name = next_client["name"]
         interval = next_client["interval"]
 
+        # ========================================================
+        # Circuit breaker (open -> esperar backoff)
+        # ========================================================
+        breaker = sched[name]["breaker"]
+
+        if not breaker.allow(now):
+            sched[name]["next_run"] = breaker.retry_at
+            continue
+
         log.info("Processing client: '%s'", name)
 
-        if sched[name]["rate_limit_until"] > now:
-            sched[name]["next_run"] = sched[name]["rate_limit_until"]
+        # ========================================================
+        # Backpressure (disco / lag del consumidor)
+        # ========================================================
+        level = backpressure.evaluate(name, sched[name]["log_path"])
+
+        if level == PAUSE:
+            sched[name]["next_run"] = now + backpressure.interval_for(
+                level, interval
+            )
+            log.warning("Fetching paused for %s (backpressure)", name)
+            metrics.write_metrics()
             continue
 
         state = load_state(name)
@@ -142,8 +259,11 @@ def main():
         if not sched[name]["start_initialized"]:
             mode = next_client.get("start_mode", "state")
 
+            tie_ids = []
+
             if mode == "state" and "last_ts" in state:
                 last_ts = state["last_ts"]
+                tie_ids = state.get("tie_ids", [])
 
             elif mode == "now":
                 last_ts = utc_now_iso()
@@ -162,58 +282,111 @@ def main():
 
         else:
             last_ts = state.get("last_ts", utc_now_iso())
+            tie_ids = state.get("tie_ids", [])
             anchor = state.get("anchor")
 
+        try:
+            cursor = Cursor(last_ts, tie_ids)
+        except ValueError as e:
+            log.error("%s for %s, restarting from now", e, name)
+            cursor = Cursor(utc_now_iso())
+            anchor = None
+
         total_events = 0
         page = 0
-        last_event_ts = last_ts
+        started = time.monotonic()
+        budget_wait = 0.0
+        budget_resume = 0.0
+        failure_delay = 0.0
 
         try:
             while True:
+                # ------------------------------------------------
+                # Cancelación entre páginas
+                # ------------------------------------------------
+                if shutdown_event.is_set():
+                    log.warning(
+                        "Shutdown signal received (%s), pagination cancelled for %s",
+                        shutdown_signal,
+                        name
+                    )
+                    break
+
+                # ------------------------------------------------
+                # Rate budget compartido por la credencial
+                # ------------------------------------------------
+                budget_wait = sched[name]["group"].budget.acquire(name)
+                if budget_wait > 0:
+                    budget_resume = time.monotonic() + budget_wait
+                    log.info(
+                        "Rate budget exhausted for %s, resuming in %.1fs",
+                        name,
+                        budget_wait
+                    )
+                    break
+
                 page += 1
 
                 items, next_anchor = fetch_events(
                     auth=sched[name]["auth"],
-                    last_ts=last_event_ts,
+                    last_ts=cursor.last_ts,
                     anchor=anchor,
-                    org_id=next_client.get("organization_id")
+                    org_id=next_client.get("organization_id"),
+                    enricher=sched[name]["enricher"]
                 )
 
                 if not items:
                     break
 
-                items.sort(
-                    key=lambda e: e.get("withsecure", {}).get(
-                        "persistenceTimestamp", ""
-                    )
-                )
+                # Orden O(n) + dedupe por tie-set + avance del watermark
+                items = cursor.ingest(items, tenant=name)
 
+                # Shed después de avanzar el cursor: los eventos
+                # descartados no se vuelven a pedir en el siguiente ciclo
+                items = backpressure.shed(name, level, items)
                 save_events(name, items)
-
-                for ev in items:
-                    ws = ev.get("withsecure", {})
-                    ts = ws.get("persistenceTimestamp")
-
-                    if not ts:
-                        continue
-
-                    total_events += 1
-
-                    if ts > last_event_ts:
-                        last_event_ts = ts
+                total_events += len(items)
+
+                # ------------------------------------------------
+                # Checkpoint por página
+                # ------------------------------------------------
+                save_state(
+                    name,
+                    {
+                        **cursor.state(),
+                        "anchor": next_anchor or anchor
+                    }
+                )
 
                 if not next_anchor:
                     break
 
                 anchor = next_anchor
 
-        except RuntimeError as e:
-            msg = str(e)
-            if "429" in msg:
-                sched[name]["rate_limit_until"] = now + interval
-                log.warning("Rate-limit detected for %s", name)
-            else:
-                log.error("Client '%s' failed: %s", name, msg)
+                # Re-evaluar entre páginas: pausa a mitad de paginación
+                level = backpressure.evaluate(name, sched[name]["log_path"])
+                if level == PAUSE:
+                    log.warning(
+                        "Pagination interrupted for %s (backpressure)",
+                        name
+                    )
+                    break
+
+            if page:
+                breaker.record_success()
+
+        except (RuntimeError, requests.RequestException) as e:
+            log.error(
+                "Client '%s' failed: %s",
+                name,
+                e,
+                extra={"tenant": name, "page": page}
+            )
+            failure_delay = breaker.record_failure(e, time.monotonic())
+
+            # El 429 limita la credencial: frena a todos sus tenants
+            if failure_delay > 0 and classify(e) == THROTTLE:
+                sched[name]["group"].budget.block_until(breaker.retry_at)
 
         # ========================================================
         # Guardar estado SIEMPRE
@@ -221,28 +394,54 @@ def main():
         save_state(
             name,
             {
-                "last_ts": last_event_ts,
+                **cursor.state(),
                 "anchor": anchor
             }
         )
 
-        sched[name]["next_run"] = now + interval
+        effective_interval = backpressure.interval_for(level, interval)
+        sched[name]["next_run"] = now + effective_interval
+        if budget_wait > 0:
+            # Reanudar justo cuando haya presupuesto (más pronto que el
+            # intervalo, o más tarde si un 429 bloqueó la credencial)
+            effective_interval = round(budget_wait, 1)
+            sched[name]["next_run"] = budget_resume
+        if failure_delay > 0:
+            effective_interval = failure_delay
+            sched[name]["next_run"] = breaker.retry_at
+
+        metrics.inc("withsecure_events_total", total_events, tenant=name)
+        metrics.set_gauge("withsecure_log_records_dropped", dropped_records())
+        metrics.write_metrics()
+
+        duration = round(time.monotonic() - started, 3)
 
         log.info(
-            "Polling finished for %s | events=%s pages=%s last_ts=%s",
+            "Polling finished for %s | events=%s pages=%s last_ts=%s duration=%ss",
             name,
             total_events,
             page,
-            last_event_ts
+            cursor.last_ts,
+            duration,
+            extra={"tenant": name, "page": page, "duration": duration}
         )
 
         log.info(
-            "Next polling for %s in %s seconds",
+            "Next polling for %s in %s seconds%s",
             name,
-            interval
+            effective_interval,
+            "" if level == NORMAL else f" (backpressure={level})"
+        )
+
+    if shutdown_signal is not None:
+        log.warning(
+            "Shutdown signal received (%s), drained within %ss",
+            shutdown_signal,
+            shutdown_drain_seconds
         )
 
     log.warning("Collector stopped gracefully")
+    stop_logger()
 
 
 if __name__ == "__main__":
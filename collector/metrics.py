@@ -0,0 +1,67 @@
+# collector/metrics.py
+# VERSION: v1.0.0
+#
+# PURPOSE:
+# - Registro en memoria de métricas (gauges / counters) por tenant
+# - Exporta en formato Prometheus textfile (node_exporter)
+# - Sin dependencias externas
+
+import logging
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+METRICS_DIR = Path("metrics")
+METRICS_FILE = METRICS_DIR / "withsecure-collector.prom"
+
+_gauges = {}
+_counters = {}
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted(labels.items()))
+
+
+def set_gauge(name: str, value, **labels):
+    """
+    Fija el valor actual de un gauge.
+    """
+    _gauges[_key(name, labels)] = value
+
+
+def inc(name: str, value=1, **labels):
+    """
+    Incrementa un counter (monótono).
+    """
+    key = _key(name, labels)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def _format(name, labels, value):
+    if labels:
+        rendered = ",".join(f'{k}="{v}"' for k, v in labels)
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+
+def write_metrics():
+    """
+    Escribe todas las métricas en METRICS_FILE de forma atómica.
+    """
+    lines = []
+
+    for kind, registry in (("gauge", _gauges), ("counter", _counters)):
+        seen = set()
+        for (name, labels), value in sorted(registry.items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} {kind}")
+                seen.add(name)
+            lines.append(_format(name, labels, value))
+
+    try:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = METRICS_FILE.with_suffix(".tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        tmp.replace(METRICS_FILE)
+    except OSError as e:
+        log.warning("Metrics export failed: %s", e)
@@ -0,0 +1,224 @@
+# collector/replay.py
+# VERSION: v1.0.2
+#
+# FIX:
+# - Segmentos rotados con dateext (<cliente>.log-YYYYMMDD) incluidos
+# - Índices localizados por inode en cualquier segmento rotado
+#
+# PURPOSE:
+# - Re-exporta eventos de un rango [from, to) por persistenceTimestamp
+# - Usa el índice temporal (<log>.idx) para saltar directo a los bloques
+# - Lee con mmap y copia las líneas tal cual (sin re-serializar)
+# - Filtros opcionales por engine y riesgo mínimo
+# - Segmentos rotados (<cliente>.log.N / <cliente>.log-YYYYMMDD) incluidos;
+#   sin índice -> scan lineal
+#
+# USO:
+#   python -m collector.replay --client innovare \
+#       --from 2025-11-01T00:00:00Z --to 2025-11-02T00:00:00Z \
+#       [--engine edr] [--min-risk HIGH] [--out archivo.log | --out -]
+#
+#   Para re-ingestar en Wazuh basta con --out events/<cliente>-replay.log
+#   (cubierto por el <localfile> events/*.log).
+
+import argparse
+import json
+import logging
+import mmap
+import re
+import sys
+from pathlib import Path
+
+from collector.backpressure import RISK_ORDER, RISK_RANK
+from collector.event_index import INDEX_SUFFIX, base_log, load_blocks, prune
+from collector.log_files import EVENTS_DIR
+from collector.timestamps import to_epoch_us
+
+log = logging.getLogger(__name__)
+
+_TS_RE = re.compile(rb'"persistenceTimestamp":\s*"([^"]+)"')
+
+
+# ----------------------------------------------------------------------
+# Segment discovery
+# ----------------------------------------------------------------------
+def client_segments(client: str) -> list:
+    """
+    Segmentos del cliente, del más antiguo al actual.
+    Los comprimidos (.gz) no se soportan.
+    """
+    current = EVENTS_DIR / f"{client}.log"
+    prune(current)
+
+    # Rotación numerada (.N) y con dateext (-YYYYMMDD)
+    rotated = [
+        p for p in EVENTS_DIR.glob(f"{client}.log*")
+        if p != current
+        and base_log(p) == current
+        and not p.name.endswith(INDEX_SUFFIX)
+        and not p.name.endswith(".gz")
+    ]
+    rotated.sort(key=lambda p: p.stat().st_mtime)
+
+    if current.exists():
+        rotated.append(current)
+
+    return rotated
+
+
+def scan_ranges(size: int, blocks, start_us: int, end_us: int) -> list:
+    """
+    Rangos de bytes a leer. Los huecos no indexados (datos previos al
+    índice o un bloque sin registrar tras un crash) se leen completos.
+    """
+    if blocks is None:
+        return [(0, size)] if size else []
+
+    ranges = []
+    covered = 0
+
+    for offset, end, min_us, max_us in sorted(blocks):
+        offset, end = min(offset, size), min(end, size)
+
+        if offset > covered:
+            ranges.append((covered, offset))
+
+        if max_us >= start_us and min_us < end_us and end > offset:
+            ranges.append((offset, end))
+
+        covered = max(covered, end)
+
+    if covered < size:
+        ranges.append((covered, size))
+
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+# ----------------------------------------------------------------------
+# Filters
+# ----------------------------------------------------------------------
+def _matches(line: bytes, engines, min_rank) -> bool:
+    if not engines and min_rank is None:
+        return True
+
+    try:
+        ws = json.loads(line).get("withsecure", {})
+    except ValueError:
+        return False
+
+    if engines and ws.get("engine") not in engines:
+        return False
+
+    if min_rank is not None:
+        details = ws.get("details") or {}
+        rank = RISK_RANK.get(details.get("risk"))
+        if rank is None or rank < min_rank:
+            return False
+
+    return True
+
+
+# ----------------------------------------------------------------------
+# Replay
+# ----------------------------------------------------------------------
+def replay_segment(path: Path, out, start_us, end_us, engines=None, min_rank=None) -> int:
+    size = path.stat().st_size
+    if not size:
+        return 0
+
+    blocks = load_blocks(path)
+    if blocks is None:
+        log.info("No index for %s, scanning whole segment", path)
+
+    written = 0
+
+    with path.open("rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start, end in scan_ranges(size, blocks, start_us, end_us):
+            pos = start
+            while pos < end:
+                nl = mm.find(b"\n", pos, end)
+                if nl == -1:
+                    nl = end
+                line = mm[pos:nl]
+                pos = nl + 1
+
+                m = _TS_RE.search(line)
+                if not m:
+                    continue
+
+                ts = to_epoch_us(m.group(1).decode("ascii", "replace"))
+                if ts is None or ts < start_us or ts >= end_us:
+                    continue
+
+                if not _matches(line, engines, min_rank):
+                    continue
+
+                out.write(line)
+                out.write(b"\n")
+                written += 1
+
+    return written
+
+
+def replay(clients, start_us, end_us, out, engines=None, min_rank=None) -> int:
+    total = 0
+    for client in clients:
+        for segment in client_segments(client):
+            count = replay_segment(segment, out, start_us, end_us, engines, min_rank)
+            log.info("%s: %s events", segment, count)
+            total += count
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m collector.replay",
+        description="Re-exporta eventos WithSecure por rango de persistenceTimestamp"
+    )
+    parser.add_argument("--client", action="append", required=True,
+                        help="Nombre del cliente (repetible)")
+    parser.add_argument("--from", dest="start", required=True,
+                        help="Inicio inclusivo (ISO 8601 o epoch)")
+    parser.add_argument("--to", dest="end", required=True,
+                        help="Fin exclusivo (ISO 8601 o epoch)")
+    parser.add_argument("--engine", action="append",
+                        help="Filtra por engine (repetible)")
+    parser.add_argument("--min-risk", choices=RISK_ORDER,
+                        help="Riesgo mínimo")
+    parser.add_argument("--out", default="-",
+                        help="Archivo de salida ('-' = stdout)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=sys.stderr,
+        format="%(asctime)s [%(levelname)s] %(filename)s: %(message)s"
+    )
+
+    start_us = to_epoch_us(args.start)
+    end_us = to_epoch_us(args.end)
+    if start_us is None or end_us is None or start_us >= end_us:
+        parser.error("invalid --from/--to range")
+
+    min_rank = RISK_RANK[args.min_risk] if args.min_risk else None
+    engines = set(args.engine) if args.engine else None
+
+    if args.out == "-":
+        total = replay(args.client, start_us, end_us, sys.stdout.buffer, engines, min_rank)
+    else:
+        with open(args.out, "ab") as out:
+            total = replay(args.client, start_us, end_us, out, engines, min_rank)
+
+    log.info("Replay finished: %s events", total)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
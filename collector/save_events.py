@@ -1,7 +1,10 @@
 # collector/save_events.py
-# VERSION: v1.3.0
+# VERSION: v1.4.0
 #
 # CHANGELOG:
+# - NEW: registra cada bloque en el índice temporal (<log>.idx)
+# - Escritura binaria en un solo write por página
+# - Log por página muestreado por tenant (hot-path)
 # - Crea directorio si no existe
 # - Mantiene formato JSONL
 
@@ -9,6 +12,9 @@ import json
 from pathlib import Path
 import logging
 
+from collector.event_index import append_block
+from collector.timestamps import to_epoch_us
+
 log = logging.getLogger(__name__)
 
 
@@ -24,13 +30,35 @@ def save_events(output_name: str, events: list):
     output_path = Path(output_log)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with output_path.open("a", encoding="utf-8") as fh:
-        for event in events:
-            fh.write(json.dumps(event, ensure_ascii=False) + "\n")
+    data = "".join(
+        json.dumps(event, ensure_ascii=False) + "\n"
+        for event in events
+    ).encode("utf-8")
+
+    with output_path.open("ab") as fh:
+        offset = fh.tell()
+        fh.write(data)
         fh.flush()
+        end = fh.tell()
+
+    # ------------------------------------------------------------
+    # Índice temporal (persistenceTimestamp -> offset)
+    # ------------------------------------------------------------
+    stamps = [
+        to_epoch_us(event.get("withsecure", {}).get("persistenceTimestamp"))
+        for event in events
+    ]
+    stamps = [ts for ts in stamps if ts is not None]
+
+    if stamps:
+        try:
+            append_block(output_path, offset, end, min(stamps), max(stamps))
+        except OSError as e:
+            log.warning("Event index update failed for %s: %s", output_path, e)
 
     log.debug(
         "Saved %s events into %s",
         len(events),
-        output_path
+        output_path,
+        extra={"tenant": output_name, "sample": True}
     )
@@ -1,6 +1,8 @@
 # collector/state.py
-# VERSION: v1.3.0
+# VERSION: v1.3.1
 # CHANGELOG:
+# - Escritura atómica (tmp + replace): un corte a mitad de escritura
+#   nunca deja un JSON truncado
 # - Guarda correctamente anchor por cliente
 
 import json
@@ -17,4 +19,6 @@ def load_state(client):
 
 def save_state(client, state):
     f = STATE_DIR / f"{client}.json"
-    f.write_text(json.dumps(state, indent=2))
+    tmp = f.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    tmp.replace(f)
@@ -0,0 +1,89 @@
+# collector/timestamps.py
+# VERSION: v1.0.1
+#
+# FIX:
+# - Campos fuera de rango (mes 13, 30 de febrero, offset +25:00)
+#   devuelven None en lugar de lanzar o desplazar la fecha
+#
+# PURPOSE:
+# - Convierte timestamps WithSecure / config a epoch en microsegundos (int)
+# - Acepta ISO 8601 con Z, +00:00 o +0000 y cualquier precisión fraccional
+# - Acepta epoch en segundos o milisegundos
+# - Acepta datetime (YAML convierte fechas sin comillas)
+# - Los enteros comparan correctamente, a diferencia de los strings ISO
+
+import calendar
+import re
+import time
+from datetime import datetime, timezone
+
+_ISO_RE = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})"
+    r"(?:[.,](\d+))?"
+    r"(Z|[+-]\d{2}:?\d{2})?$"
+)
+
+
+def to_epoch_us(value):
+    """
+    Devuelve epoch UTC en microsegundos, o None si no se reconoce.
+    Un ISO sin zona horaria se interpreta como UTC.
+    """
+    if isinstance(value, bool):
+        return None
+
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        delta = value - datetime(1970, 1, 1, tzinfo=timezone.utc)
+        return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+    if isinstance(value, (int, float)) or (
+        isinstance(value, str) and value.isdigit()
+    ):
+        number = int(value)
+        if number > 1_000_000_000_000:
+            return number * 1000
+        return number * 1_000_000
+
+    if not isinstance(value, str):
+        return None
+
+    m = _ISO_RE.match(value.strip())
+    if not m:
+        return None
+
+    year, month, day, hour, minute, second, frac, tz = m.groups()
+
+    # datetime valida rangos (mes 13, 30 de febrero, hora 25...)
+    try:
+        dt = datetime(
+            int(year), int(month), int(day),
+            int(hour), int(minute), int(second),
+            tzinfo=timezone.utc
+        )
+    except ValueError:
+        return None
+
+    seconds = calendar.timegm(dt.utctimetuple())
+
+    micros = int((frac or "0")[:6].ljust(6, "0"))
+
+    if tz and tz != "Z":
+        sign = -1 if tz[0] == "-" else 1
+        digits = tz[1:].replace(":", "")
+        tz_hours, tz_minutes = int(digits[:2]), int(digits[2:])
+        if tz_hours > 23 or tz_minutes > 59:
+            return None
+        seconds -= sign * (tz_hours * 3600 + tz_minutes * 60)
+
+    return seconds * 1_000_000 + micros
+
+
+def from_epoch_us(value: int) -> str:
+    """
+    Formatea epoch en microsegundos como YYYY-MM-DDTHH:MM:SS.ffffffZ.
+    """
+    seconds, micros = divmod(value, 1_000_000)
+    base = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+    return f"{base}.{micros:06d}Z"